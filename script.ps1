@@ -4,8 +4,11 @@
 $scriptPath = "./speedtest"
 $scriptArguments = "-f", "csv"
 
+# Capture the run time once so the filename date and the row timestamp always agree
+$runTime = Get-Date
+
 # Get the current date in YYYY-MM-DD format for the filename
-$currentDate = Get-Date -Format "yyyy-MM-dd"
+$currentDate = $runTime.ToString("yyyy-MM-dd")
 $outputPath = "data/speedtest_results_$currentDate.csv"
 $logPath = "logs/speedtest_log_$currentDate.txt"
 
@@ -32,8 +35,8 @@ function Write-Log {
 
 # Function to run a single speedtest and append results
 function Test-SpeedTest {
-    # Get the current timestamp
-    $timestamp = Get-Date -Format "yyyy-MM-dd HH:mm:ss"
+    # Get the timestamp of this run
+    $timestamp = $runTime.ToString("yyyy-MM-dd HH:mm:ss")
     
     # Log start of test
     # Write-Log "Starting speedtest"
@@ -62,9 +65,7 @@ function Test-SpeedTest {
                     Write-Log "Created new file: $outputPath"
                 } else {
                     # Append to the existing file without the header
-                    $csvData | Export-Csv -Path "temp.csv" -NoTypeInformation
-                    Get-Content "temp.csv" | Select-Object -Skip 1 | Add-Content -Path $outputPath
-                    Remove-Item -Path "temp.csv"
+                    $csvData | Export-Csv -Path $outputPath -NoTypeInformation -Append
                     # Write-Log "Appended to existing file: $outputPath"
                 }
                 
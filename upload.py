@@ -1,18 +1,154 @@
 import os
-import glob
+import functools
 import logging
+from logging.handlers import RotatingFileHandler
+import shutil
+import tempfile
+import pandas as pd
 from google.cloud import bigquery
 from google.oauth2 import service_account
 
 # Configure logging
 logging.basicConfig(
-    filename='upload_log.txt',
+    handlers=[RotatingFileHandler('upload_log.txt', maxBytes=1_000_000, backupCount=3)],
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Schema of the CSVs written by script.ps1, in column order
+SCHEMA = [
+    bigquery.SchemaField("Server_Name", "STRING"),
+    bigquery.SchemaField("Server_ID", "INTEGER"),
+    bigquery.SchemaField("Latency", "FLOAT"),
+    bigquery.SchemaField("Jitter", "FLOAT"),
+    bigquery.SchemaField("Packet_Loss", "FLOAT"),
+    bigquery.SchemaField("Download", "INTEGER"),
+    bigquery.SchemaField("Upload", "INTEGER"),
+    bigquery.SchemaField("Download_Bytes", "INTEGER"),
+    bigquery.SchemaField("Upload_Bytes", "INTEGER"),
+    bigquery.SchemaField("Share_URL", "STRING"),
+    bigquery.SchemaField("Download_Server_Count", "INTEGER"),
+    bigquery.SchemaField("Download_Latency", "FLOAT"),
+    bigquery.SchemaField("Download_Latency_Jitter", "FLOAT"),
+    bigquery.SchemaField("Download_Latency_Low", "FLOAT"),
+    bigquery.SchemaField("Download_Latency_High", "FLOAT"),
+    bigquery.SchemaField("Upload_Latency", "FLOAT"),
+    bigquery.SchemaField("Upload_Latency_Jitter", "FLOAT"),
+    bigquery.SchemaField("Upload_Latency_Low", "FLOAT"),
+    bigquery.SchemaField("Upload_Latency_High", "FLOAT"),
+    bigquery.SchemaField("Idle_Latency", "FLOAT"),
+    bigquery.SchemaField("Timestamp", "TIMESTAMP"),
+]
+
+# Written by the CLI in place of a value it can't measure, e.g. packet loss (see speedtest.md)
+NULL_MARKER = "Not available"
+
+@functools.lru_cache(maxsize=1)
+def get_credentials(credentials_path):
+    """
+    Load service account credentials once per process so the access token
+    is reused and refreshed in place across uploads.
+    """
+    return service_account.Credentials.from_service_account_file(credentials_path)
+
+@functools.lru_cache(maxsize=1)
+def get_client(credentials_path, project_id):
+    """
+    Return a BigQuery client shared across uploads, keeping its connection pool warm.
+    """
+    return bigquery.Client(credentials=get_credentials(credentials_path), project=project_id)
+
+@functools.lru_cache(maxsize=1)
+def get_storage_client(credentials_path, project_id):
+    """
+    Return a Cloud Storage client shared across uploads. google-cloud-storage is
+    only needed when a staging bucket is used, so it is imported here.
+    """
+    from google.cloud import storage
+    return storage.Client(credentials=get_credentials(credentials_path), project=project_id)
+
+def csv_files_to_parquet(csv_files):
+    """
+    Combine CSV files written by script.ps1 into a single temporary Parquet file.
+    Every column is renamed and cast to its SCHEMA type, so a column that is blank
+    in every row still has the right Parquet type. Values that don't parse as their
+    SCHEMA type, including fractional INTEGER values, become nulls and are counted in the log.
+
+    Parameters:
+    - csv_files: Paths of the CSV files to combine, in the order to write them
+
+    Returns the path of the Parquet file. The caller is responsible for deleting it.
+    """
+    column_names = [field.name for field in SCHEMA]
+    df = pd.concat(
+        [pd.read_csv(csv_file, header=0, names=column_names, dtype=str, na_values=[NULL_MARKER])
+         for csv_file in csv_files],
+        ignore_index=True,
+    )
+
+    for field in SCHEMA:
+        values = df[field.name]
+        if field.field_type == "STRING":
+            converted = values.astype("string")
+        elif field.field_type == "INTEGER":
+            numbers = pd.to_numeric(values, errors="coerce")
+            # Int64 refuses fractional values, so null them like any other unparseable value
+            converted = numbers.where(numbers % 1 == 0).astype("Int64")
+        elif field.field_type == "FLOAT":
+            converted = pd.to_numeric(values, errors="coerce").astype("float64")
+        elif field.field_type == "TIMESTAMP":
+            converted = pd.to_datetime(values, errors="coerce", utc=True)
+        else:
+            continue
+
+        coerced = int(values.notna().sum() - converted.notna().sum())
+        if coerced:
+            logging.warning("Set %d value(s) in %s to null: not a valid %s",
+                            coerced, field.name, field.field_type)
+        df[field.name] = converted
+
+    with tempfile.NamedTemporaryFile(suffix=".parquet", delete=False) as agg:
+        try:
+            df.to_parquet(agg, engine="pyarrow", compression="snappy", index=False,
+                          coerce_timestamps="us")  # BigQuery TIMESTAMP holds microseconds
+        except Exception:
+            agg.close()
+            os.remove(agg.name)
+            raise
+    return agg.name
+
+def move_processed_files(csv_files, processed_directory, same_device):
+    """
+    Move uploaded CSV files into the processed directory. If a file with the same name
+    is already there (script.ps1 recreates today's file after it has been moved), the
+    moved file gets a numbered suffix so earlier archived rows are kept.
+
+    Parameters:
+    - csv_files: Paths of the CSV files to move
+    - processed_directory: Directory to move the files to
+    - same_device: Whether processed_directory is on the same filesystem as the files.
+      If so, files are renamed with os.replace; otherwise they are copied with shutil.move
+    """
+    move = os.replace if same_device else shutil.move
+    for csv_file in csv_files:
+        file_name = os.path.basename(csv_file)
+        base, ext = os.path.splitext(file_name)
+        processed_file_path = os.path.join(processed_directory, file_name)
+        suffix = 1
+        while os.path.exists(processed_file_path):
+            processed_file_path = os.path.join(processed_directory, f"{base}_{suffix}{ext}")
+            suffix += 1
+        if suffix > 1:
+            logging.info("%s already processed; archiving as %s",
+                         file_name, os.path.basename(processed_file_path))
+
+        try:
+            move(csv_file, processed_file_path)
+        except Exception as e:
+            logging.error("Error moving %s to %s: %s", csv_file, processed_directory, e)
+
 def upload_csv_to_bigquery(csv_directory, processed_directory, credentials_path,
-                            project_id, dataset_id, table_id):
+                            project_id, dataset_id, table_id, bucket_name=None):
     """
     Upload CSV files to BigQuery and move processed files to another directory.
     Logs the process to a log file.
@@ -24,49 +160,88 @@ def upload_csv_to_bigquery(csv_directory, processed_directory, credentials_path,
     - project_id: Google Cloud project ID
     - dataset_id: BigQuery dataset ID
     - table_id: BigQuery table ID
+    - bucket_name: Optional GCS bucket to stage the upload in. When set, the data is
+      uploaded to GCS and loaded with load_table_from_uri instead of a direct file POST
     """
     # Set up credentials and client
     try:
-        credentials = service_account.Credentials.from_service_account_file(credentials_path)
-        client = bigquery.Client(credentials=credentials, project=project_id)
+        client = get_client(credentials_path, project_id)
+        bucket = None
+        if bucket_name:
+            bucket = get_storage_client(credentials_path, project_id).bucket(bucket_name)
     except Exception as e:
-        logging.error(f"Error authenticating with Google Cloud: {e}")
+        logging.error("Error authenticating with Google Cloud: %s", e)
         return
 
     # Get full table reference
     table_ref = f"{project_id}.{dataset_id}.{table_id}"
 
+    if not os.path.isdir(csv_directory):
+        logging.warning("CSV directory %s does not exist; nothing to upload", csv_directory)
+        return
+
     # Create processed directory if it doesn't exist
     if not os.path.exists(processed_directory):
         os.makedirs(processed_directory)
 
+    # A rename only works within one filesystem
+    same_device = os.stat(csv_directory).st_dev == os.stat(processed_directory).st_dev
+    if not same_device:
+        logging.warning("%s is on a different filesystem than %s; "
+                        "processed files will be copied instead of renamed",
+                        processed_directory, csv_directory)
 
-    # Get all CSV files
-    csv_files = glob.glob(os.path.join(csv_directory, "*.csv"))
+    # Get all CSV files, oldest first
+    with os.scandir(csv_directory) as it:
+        entries = [e for e in it if e.is_file(follow_symlinks=False) and e.name.endswith(".csv")]
+    entries.sort(key=lambda e: e.stat(follow_symlinks=False).st_mtime)
+    csv_files = [e.path for e in entries]
 
 
-    for csv_file in csv_files:
-        file_name = os.path.basename(csv_file)
+    if not csv_files:
+        return
 
+    file_names = ", ".join(os.path.basename(csv_file) for csv_file in csv_files)
 
-        # Configure the load job
-        job_config = bigquery.LoadJobConfig(
-            source_format=bigquery.SourceFormat.CSV,
-            skip_leading_rows=1,  # Skip header row
-            autodetect=True,  # Auto-detect schema
-        )
+    # Load every pending file as a single Parquet upload instead of one CSV job per file
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        schema=SCHEMA,
+    )
 
-        try:
-            with open(csv_file, "rb") as source_file:
+    aggregated_file = None
+    blob = None
+    try:
+        aggregated_file = csv_files_to_parquet(csv_files)
+        if bucket is not None:
+            staged_blob = bucket.blob(os.path.basename(aggregated_file), chunk_size=8 * 1024 * 1024)
+            staged_blob.upload_from_filename(aggregated_file, if_generation_match=0)
+            blob = staged_blob
+            source_uri = f"gs://{bucket_name}/{blob.name}"
+            job = client.load_table_from_uri(source_uri, table_ref, job_config=job_config)
+        else:
+            with open(aggregated_file, "rb") as source_file:
                 job = client.load_table_from_file(source_file, table_ref, job_config=job_config)
 
+        job.result()
 
-            job.result()
-            processed_file_path = os.path.join(processed_directory, file_name)
-            os.rename(csv_file, processed_file_path)
+    except Exception as e:
+        logging.error("Error processing %s: %s", file_names, e)
+        return
 
-        except Exception as e:
-            logging.error(f"Error processing {file_name}: {e}")
+    finally:
+        if aggregated_file is not None:
+            try:
+                os.remove(aggregated_file)
+            except Exception as e:
+                logging.warning("Error deleting temporary file %s: %s", aggregated_file, e)
+        if blob is not None:
+            try:
+                blob.delete()
+            except Exception as e:
+                logging.warning("Error deleting staged file %s: %s", blob.name, e)
+
+    move_processed_files(csv_files, processed_directory, same_device)
 
 if __name__ == "__main__":
     upload_csv_to_bigquery(